@@ -1,7 +1,10 @@
 from .config import Configuration
 from .log import Log
 from .database import MongoDB
+from .scheduler import Scheduler
+from .admission import AdmissionControl
+from .tracing import Tracer
 from .bot import Bot
 from .reminder import Reminder
 
-__all__ = (Configuration, Log, MongoDB, Bot, Reminder)
+__all__ = (Configuration, Log, MongoDB, Scheduler, AdmissionControl, Tracer, Bot, Reminder)
@@ -0,0 +1,165 @@
+from warnings import warn as console_warning
+from logging import debug, info
+from asyncio import Semaphore
+from time import monotonic
+from discord.ext import commands
+from classes import Configuration, MongoDB
+
+__all__ = "AdmissionControl", "RateLimited", "DatabaseBusy", "TooManyPendingReminders"
+
+MAX_TRACKED_USERS = 1000
+
+
+# The following classes MUST be a child of commands.CommandError so they are handled by on_command_error
+class RateLimited(commands.CommandError):
+    def __init__(self):
+        super().__init__()
+
+
+class DatabaseBusy(commands.CommandError):
+    def __init__(self):
+        super().__init__()
+
+
+class TooManyPendingReminders(commands.CommandError):
+    def __init__(self):
+        super().__init__()
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, rate: float):
+        """
+        A plain token bucket. Starts full, refills at rate tokens per second up to capacity.
+        :param capacity: The most tokens the bucket can hold, i.e. the allowed burst.
+        :param rate: Tokens added back per second.
+        """
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = monotonic()
+
+    def _refill(self) -> None:
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class AdmissionControl:
+    def __init__(self, configuration_file: Configuration, database_connection: MongoDB):
+        """
+        Decides whether a command may go on to the database. Everything here is kept in memory, so a rejection never
+        costs a query. Limits come from the ADMISSION section of the configuration file.
+        The queries semaphore is shared by every database call the bot makes, commands and delivery alike.
+        :param configuration_file: The Configuration object for the bot.
+        :param database_connection: The MongoDB connection, used once per user to count pending reminders.
+        """
+        self.configuration_file = configuration_file
+        self.database_connection = database_connection
+        self._validate()
+
+        section = self.configuration_file["ADMISSION"]
+        self.burst = section.getfloat("commandBurst")
+        self.rate = section.getfloat("commandRate")
+        self.max_concurrent_queries = section.getint("maxConcurrentQueries")
+        self.max_pending_reminders = section.getint("maxPendingReminders")
+
+        self.buckets = {}
+        self.pending = {}
+        self.queries = Semaphore(self.max_concurrent_queries)
+
+    def _validate(self) -> None:
+        try:
+            assert "ADMISSION" in self.configuration_file
+        except AssertionError:
+            console_warning("No ADMISSION section in configuration file. Reverting to default.")
+            self.configuration_file.fallback(category="ADMISSION")
+
+        for key in ("commandBurst", "commandRate", "maxConcurrentQueries", "maxPendingReminders"):
+            try:
+                assert key in self.configuration_file["ADMISSION"]
+            except AssertionError:
+                console_warning(f"No {key} in the ADMISSION section in configuration file. Reverting to default.")
+                self.configuration_file.fallback(category="ADMISSION", item=key)
+
+    async def admit(self, context: commands.Context) -> None:
+        """
+        A discord.py before_invoke hook. Takes a token from the author's bucket and makes sure the database isn't
+        already at its concurrency cap. This is a hook rather than a check so @@help, which runs every check, doesn't
+        spend tokens or hide commands.
+        :param context: A context passed from a command event via discord.py
+        :return: None
+        :exception: RateLimited
+        :exception: DatabaseBusy
+        """
+        user = context.message.author.id
+        if user not in self.buckets:
+            if len(self.buckets) > MAX_TRACKED_USERS:
+                # Forget anyone whose bucket has refilled, they'd get a full one back anyway.
+                self.buckets = {key: value for key, value in self.buckets.items() if not value.full()}
+            self.buckets[user] = TokenBucket(capacity=self.burst, rate=self.rate)
+
+        if not self.buckets[user].take():
+            debug(f"classes.admission.AdmissionControl: Rate limited {user}")
+            raise RateLimited
+        if self.queries.locked():
+            info(f"classes.admission.AdmissionControl: Database at {self.max_concurrent_queries} concurrent "
+                 f"queries. Turned away {user}")
+            raise DatabaseBusy
+
+    async def admit_reminder(self, context: commands.Context) -> None:
+        """
+        A discord.py before_invoke hook. Does everything admit does, then reserves one of the author's pending
+        reminder slots, or rejects the reminder if they have none left. The caller must give the slot back with
+        remove_pending if the reminder isn't saved. Reserving here, before anything is awaited in the command,
+        means two remind commands at once can't both slip in under the cap.
+        The first remind from a user we aren't tracking costs one count query, even if its arguments turn out to be
+        invalid, since hooks run before the command body validates them.
+        :param context: A context passed from a command event via discord.py
+        :return: None
+        :exception: RateLimited
+        :exception: DatabaseBusy
+        :exception: TooManyPendingReminders
+        """
+        await self.admit(context)
+        user = context.message.author.id
+        if await self.load_pending(user) >= self.max_pending_reminders:
+            debug(f"classes.admission.AdmissionControl: {user} has too many pending reminders")
+            raise TooManyPendingReminders
+        self.pending[user] += 1
+
+    async def load_pending(self, user: int) -> int:
+        """
+        Counts a user's pending reminders in the database the first time we see them. After that the count is kept
+        up to date by admit_reminder and remove_pending.
+        :param user: The discord user ID.
+        :return: The number of pending reminders for the user.
+        """
+        if user not in self.pending:
+            if len(self.pending) > MAX_TRACKED_USERS:
+                # Forget anyone with nothing pending, it costs one count query to learn about them again.
+                self.pending = {key: value for key, value in self.pending.items() if value > 0}
+            query = {
+                "recipient": user,
+                "completed": False
+            }
+            async with self.queries:
+                count = await self.database_connection.count(database="CinnamonSwirl", collection="Reminders",
+                                                             query=query)
+            # Another remind from the same user may have counted and reserved while we waited. Keep theirs.
+            self.pending.setdefault(user, count)
+        return self.pending[user]
+
+    def remove_pending(self, user: int) -> None:
+        if self.pending.get(user, 0) > 0:
+            self.pending[user] -= 1
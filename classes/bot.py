@@ -1,18 +1,25 @@
 from discord import Intents, utils, Permissions
 from logging import debug, info, warning, error
-from re import search
+from re import compile as compile_pattern
 from datetime import datetime, timedelta
-from asyncio import proactor_events, sleep, wait_for, TimeoutError
+from time import perf_counter
+from asyncio import proactor_events, sleep, wait_for, TimeoutError, Semaphore
 from urllib import parse
 from discord.ext import commands, tasks
 from functools import wraps
 from .config import Configuration
 from .database import MongoDB
 from .reminder import Reminder
+from .scheduler import Scheduler
+from .admission import AdmissionControl, RateLimited, DatabaseBusy, TooManyPendingReminders
+from .tracing import Tracer
 from typing import Optional
 
 __all__ = "Bot",
 
+INJECTION_PATTERN = compile_pattern('[F,f]unction\\(\\)')
+UNSUPPORTED_CHARACTERS_PATTERN = compile_pattern('[$;]|\\(\\)')
+
 
 def _sanitize(context: commands.Context) -> bool:
     """
@@ -23,9 +30,9 @@ def _sanitize(context: commands.Context) -> bool:
     :exception: UnsupportedCharactersException
     """
     content = context.message.content
-    if search('[F,f]unction\\(\\)', content):
+    if INJECTION_PATTERN.search(content):
         raise AttemptedInjectionException
-    if search('[$;]|\\(\\)', content):
+    if UNSUPPORTED_CHARACTERS_PATTERN.search(content):
         raise UnsupportedCharactersException
     return True
 
@@ -60,7 +67,11 @@ class Bot:
                  intents: Intents):
         self.configuration = configuration
         self.database_connection = database_connection
-        self.buffer = RemindersBuffer(database_connection=database_connection)
+        self.tracer = Tracer(configuration_file=configuration)
+        self.admission = AdmissionControl(configuration_file=configuration, database_connection=database_connection)
+        self.buffer = RemindersBuffer(database_connection=database_connection, tracer=self.tracer,
+                                      queries=self.admission.queries)
+        self.scheduler = Scheduler(configuration_file=configuration)
 
         assert "DISCORD" in self.configuration
         for key in ("clientID", "token", "ownerID"):
@@ -123,7 +134,11 @@ class Bot:
                 AttemptedInjectionException: "You stop that. You know what you did.",
                 UnsupportedCharactersException: "Sorry, I can't support $, () or ;. Try again without those.",
                 InvalidArguments: "Sorry, you gave me something I couldn't understand. Can you try looking at @@help?",
-                DatabaseCommunicationError: "Your reminder was not saved. I'll report this to my owner."
+                DatabaseCommunicationError: "Your reminder was not saved. I'll report this to my owner.",
+                RateLimited: "Slow down a little! Try again in a few seconds.",
+                DatabaseBusy: "I'm a bit busy right now. Try again in a moment.",
+                TooManyPendingReminders: f"You already have {self.admission.max_pending_reminders} reminders "
+                                         f"waiting. Let some of them go off first."
             }
 
             # Add exceptions here to send an alert to the owner. (That could be you!)
@@ -134,7 +149,7 @@ class Bot:
             ]
 
             if exception_type in serious_errors:
-                await alert_owner(context, exception)
+                await self.alert_owner(context, exception)
 
             if exception_type in responses:
                 warning(f"bot.py: Handled exception: {exception_type}, {context.invoked_with}, "
@@ -155,22 +170,24 @@ class Bot:
             info("Bot.py: Bot successfully connected to Discord.")
 
             # Tasks must be explicitly started! Failure to add a task's start() here means the task never runs!
+            self.refresh_buffer.change_interval(seconds=self.scheduler.refresh_interval)
+            self.check_buffer.change_interval(seconds=self.scheduler.check_interval)
             self.refresh_buffer.start()
             self.check_buffer.start()
 
             self.owner = await self.bot.fetch_user(user_id=self.ownerID)
             await self.owner.send("[In Starcraft SCV voice]: Reporting for duty!")
 
-        async def alert_owner(context: Optional[commands.Context], exception: Exception):
-            # Be sure to have the bot in a server you're in and allow messages from server members.
-            debug(f"classes.bot.py: alert_owner triggered for {type(exception)}")
-            if context:
-                content = context.message.content
-            else:
-                content = "An internal task, loop or event"
-            await self.owner.send(f"Hi, I ran into an issue. Encountered {type(exception)} during\n"
-                                  f"{content}\non {datetime.now().strftime('%Y/%m/%d %H:%M:%S')}\n"
-                                  f"Please investigate.")
+    async def alert_owner(self, context: Optional[commands.Context] = None, exception: Exception = None):
+        # Be sure to have the bot in a server you're in and allow messages from server members.
+        debug(f"classes.bot.py: alert_owner triggered for {type(exception)}")
+        if context:
+            content = context.message.content
+        else:
+            content = "An internal task, loop or event"
+        await self.owner.send(f"Hi, I ran into an issue. Encountered {type(exception)} during\n"
+                              f"{content}\non {datetime.now().strftime('%Y/%m/%d %H:%M:%S')}\n"
+                              f"Please investigate.")
 
     def _commands(self):
         @self.bot.command(name="stop", hidden=True)
@@ -179,61 +196,91 @@ class Bot:
             await context.send("Signing off, bye bye!")
             await self.bot.close()  # NOTE: This would normally raise RuntimeError. See Bot._silence_event_loop_closed
 
+        @self.bot.command(name="latency", hidden=True)
+        @commands.is_owner()
+        async def latency(context):
+            await context.send(f"```\n{await self.tracer.report()}```")
+
+        @self.bot.command(name="pool", hidden=True)
+        @commands.is_owner()
+        async def pool(context):
+            health = self.database_connection.pool_health()
+            await context.send(f"Connections: {health['open']} open, {health['checked_out']} checked out, "
+                               f"{health['checking_out']} checking out. Pool size {health['min_pool_size']}-"
+                               f"{health['max_pool_size']}.")
+
         @commands.check(_sanitize)
         @self.bot.command(name="remind", aliases=("remindme", "reminder"),
                           brief="Will DM you a message you give it at the time you set",
                           usage="remind (whole number) (years/months/days/hours/minutes) (message)"
                                 "\nExample: $remindme 1 day Do Project")
         async def _remind(context, amount, units, *args):
-            info(f"classes.bot.py: remind called with {context.message.content}: {amount} {units} {args}")
-            if type(amount) is not int:
-                try:
-                    amount = int(amount)
-                except ValueError:
-                    debug("classes.bot.py: remind rejected the amount parameter. It was not an int")
-                    raise InvalidArguments
-
-            if type(units) is not str:
-                try:
-                    units = str(units)
-                except ValueError:
-                    debug("classes.bot.py: remind rejected the units parameter. It was not a str")
-                    raise InvalidArguments
-
-            if type(args) is tuple:
-                args = "{}".format(" ").join(args)
-
-            if not 0 < amount < 1000000:
-                debug("classes.bot.py: remind rejected the amount parameter. It was too high or too low")
-                await context.send(f"You can't specify more than 999,999 {units}.")
-                return
-
-            if units in ('year', 'years', 'month', 'months', 'day', 'days', 'hour', 'hours', 'minute', 'minutes'):
-                if units[len(units) - 1] != 's':
-                    units += 's'
-            else:
-                debug("classes.bot.py: remind rejected the units parameter. It was not an expected value.")
-                await context.send(f"{units} needs to be year(s), month(s), day(s), hour(s) or minute(s).")
-                return
-
-            if context and amount and units and args:
-                reminder_time = datetime.utcnow() + timedelta(**{units: amount})
-                reminder = Reminder(time=reminder_time, message=args,
-                                    recipient=context.message.author.id)
-                await reminder.write(database_connection=self.database_connection)
-
-                if reminder:
-                    self.buffer.append(reminder)
-                    info("classes.bot.py: remind accepted and committed a new reminder to the DB")
-                    response = f"Successfully created a reminder! I'll DM you in {reminder.time_remaining()}!"
+            # admit_reminder has already reserved a pending slot for this reminder. Give it back unless we commit.
+            committed = False
+            try:
+                info(f"classes.bot.py: remind called with {context.message.content}: {amount} {units} {args}")
+                if type(amount) is not int:
+                    try:
+                        amount = int(amount)
+                    except ValueError:
+                        debug("classes.bot.py: remind rejected the amount parameter. It was not an int")
+                        raise InvalidArguments
+
+                if type(units) is not str:
+                    try:
+                        units = str(units)
+                    except ValueError:
+                        debug("classes.bot.py: remind rejected the units parameter. It was not a str")
+                        raise InvalidArguments
+
+                if type(args) is tuple:
+                    args = "{}".format(" ").join(args)
+
+                if not 0 < amount < 1000000:
+                    debug("classes.bot.py: remind rejected the amount parameter. It was too high or too low")
+                    await context.send(f"You can't specify more than 999,999 {units}.")
+                    return
+
+                if units in ('year', 'years', 'month', 'months', 'day', 'days', 'hour', 'hours', 'minute', 'minutes'):
+                    if units[len(units) - 1] != 's':
+                        units += 's'
                 else:
-                    error("classes.bot.py: remind accepted but was unable to commit a new reminder to the DB")
-                    raise DatabaseCommunicationError
-            else:
-                warning("classes.bot.py: remind rejected the reminder for an unhandled reason.")
-                response = "I didn't fully understand that, check @@help remind"
+                    debug("classes.bot.py: remind rejected the units parameter. It was not an expected value.")
+                    await context.send(f"{units} needs to be year(s), month(s), day(s), hour(s) or minute(s).")
+                    return
+
+                if context and amount and units and args:
+                    reminder_time = datetime.utcnow() + timedelta(**{units: amount})
+                    reminder = Reminder(time=reminder_time, message=args,
+                                        recipient=context.message.author.id)
+                    self.tracer.stamp(reminder, "created")
+                    async with self.admission.queries:
+                        await reminder.write(database_connection=self.database_connection)
+
+                    if reminder:
+                        self.tracer.stamp(reminder, "persisted")
+                        committed = True
+                        self.buffer.append(reminder)
+                        self.tracer.stamp(reminder, "buffered")
+                        info("classes.bot.py: remind accepted and committed a new reminder to the DB")
+                        response = f"Successfully created a reminder! I'll DM you in {reminder.time_remaining()}!"
+                    else:
+                        error("classes.bot.py: remind accepted but was unable to commit a new reminder to the DB")
+                        raise DatabaseCommunicationError
+                else:
+                    warning("classes.bot.py: remind rejected the reminder for an unhandled reason.")
+                    response = "I didn't fully understand that, check @@help remind"
 
-            await context.send(response)
+                await context.send(response)
+            finally:
+                if not committed:
+                    self.admission.remove_pending(context.message.author.id)
+
+        async def _admit_remind(context):
+            # Bound methods can't be before_invoke hooks, discord.py would pass them their instance a second time.
+            await self.admission.admit_reminder(context)
+
+        _remind.before_invoke(_admit_remind)
 
         @self.bot.command(name="list", aliases=("get", "find"), help="List your upcoming reminders.")
         async def _list(context):
@@ -242,9 +289,10 @@ class Bot:
                 "recipient": context.message.author.id,
                 "completed": False
             }
-            reminders_raw = await self.database_connection.find_many(database="CinnamonSwirl", collection="Reminders",
-                                                                     query=query, length=5, sort_by="time",
-                                                                     sort_direction=1)
+            async with self.admission.queries:
+                reminders_raw = await self.database_connection.find_many(database="CinnamonSwirl",
+                                                                         collection="Reminders", query=query,
+                                                                         length=5, sort_by="time", sort_direction=1)
 
             if reminders_raw:
                 reminders = []
@@ -261,24 +309,40 @@ class Bot:
 
             await context.send(response)
 
+        async def _admit_list(context):
+            await self.admission.admit(context)
+
+        _list.before_invoke(_admit_list)
+
     @tasks.loop(minutes=5)
     async def refresh_buffer(self) -> None:
         """
-        Every 5 minutes we will ask the database for a fresh set of reminders that are coming soon.
+        Periodically ask the database for a fresh set of reminders that are coming soon. How often, and how far ahead
+        we look, is decided by the Scheduler after each refresh.
         :return: None
         """
+        if self.scheduler.recently_refreshed():
+            debug("classes.bot.py: Internal buffer was refreshed early. Skipping this refresh.")
+            return
         debug("classes.bot.py: Refreshing internal buffer for reminders.")
         try:
-            await wait_for(self.buffer.refresh(), timeout=90.0)
+            await self._refresh()
         except TimeoutError:
             error("classes.bot.py: Buffer refresh timed out.")
-            await self._events().alert_owner(exception=InternalBufferNotReady)
+            await self.alert_owner(exception=InternalBufferNotReady())
         return
 
+    async def _refresh(self) -> None:
+        await wait_for(self.buffer.refresh(look_ahead=self.scheduler.look_ahead), timeout=90.0)
+        self.scheduler.observe(due_times=[reminder.time for reminder in self.buffer],
+                               fetch_limit=self.buffer.length, latency=self.buffer.latency)
+        self.refresh_buffer.change_interval(seconds=self.scheduler.refresh_interval)
+
     @tasks.loop(minutes=1)
     async def check_buffer(self) -> None:
         """
-        Every minute we will inspect our internal list of reminders for ones happening this minute.
+        Every minute (or checkInterval seconds) we will inspect our internal list of reminders for ones happening
+        this minute. If the Scheduler saw a dense cluster of reminders coming up, refresh right after sending.
         :return: None
         """
         debug("classes.bot.py: Checking internal buffer for reminders to send")
@@ -289,7 +353,16 @@ class Bot:
             await self.send_reminders()
         except TimeoutError:
             error("classes.bot.py: Waiting for the buffer to be ready for send_reminders timed out.")
-            await self._events().alert_owner(exception=InternalBufferNotReady)
+            await self.alert_owner(exception=InternalBufferNotReady())
+            return
+
+        if self.scheduler.early_refresh_due():
+            debug("classes.bot.py: Scheduler asked for an early refresh of the internal buffer.")
+            try:
+                await self._refresh()
+            except TimeoutError:
+                error("classes.bot.py: Early buffer refresh timed out.")
+                await self.alert_owner(exception=InternalBufferNotReady())
 
     async def send_reminders(self) -> None:
         """
@@ -311,10 +384,16 @@ class Bot:
         self.buffer.ready = False
         upcoming_reminders = filter(filter_reminders, self.buffer)
         for reminder in upcoming_reminders:
+            self.tracer.stamp(reminder, "due")
+            self.tracer.stamp(reminder, "dispatched")
             recipient = await self.bot.fetch_user(user_id=reminder.recipient)
             await recipient.send(f"Reminder: {reminder.message}")
+            self.tracer.stamp(reminder, "delivered")
             self.buffer.remove(reminder)
-            await reminder.complete(database_connection=self.database_connection)
+            async with self.admission.queries:
+                await reminder.complete(database_connection=self.database_connection)
+            self.tracer.stamp(reminder, "completed")
+            self.admission.remove_pending(reminder.recipient)
         self.buffer.ready = True
         return
 
@@ -324,12 +403,16 @@ class Bot:
 
 
 class RemindersBuffer(list):
-    def __init__(self, database_connection: MongoDB):
+    def __init__(self, database_connection: MongoDB, tracer: Tracer, queries: Semaphore):
         super().__init__()
         self.database_connection = database_connection
+        self.tracer = tracer
+        self.queries = queries
         self.ready = True
+        self.length = 50
+        self.latency = 0.0
 
-    async def refresh(self) -> None:
+    async def refresh(self, look_ahead: float = 1200.0) -> None:
         debug("classes.bot.py: Refreshing internal buffer...")
 
         if not self.ready:
@@ -338,20 +421,25 @@ class RemindersBuffer(list):
 
         self.ready = False
 
-        twenty_minutes_from_now = datetime.utcnow() + timedelta(minutes=20.0)
+        look_ahead_time = datetime.utcnow() + timedelta(seconds=look_ahead)
         query = {
-            "time": {"$lt": twenty_minutes_from_now},
+            "time": {"$lt": look_ahead_time},
             "completed": False
         }
 
-        results = await self.database_connection.find_many(database="CinnamonSwirl", collection="Reminders",
-                                                           query=query, length=50, sort_by="time", sort_direction=1)
+        async with self.queries:
+            start = perf_counter()
+            results = await self.database_connection.find_many(database="CinnamonSwirl", collection="Reminders",
+                                                               query=query, length=self.length, sort_by="time",
+                                                               sort_direction=1)
+            self.latency = perf_counter() - start
         self.clear()
         for item in results:
             debug(item)
             reminder = Reminder(time=item['time'], message=item['message'],
                                 recipient=item['recipient'], _id=item['_id'])
             self.append(reminder)
+            self.tracer.stamp(reminder, "buffered")
         self.ready = True
 
     async def wait(self, interval):
@@ -44,11 +44,38 @@ class Configuration(ConfigParser):
                 "connectionString": "mongodb://localhost:27017/",
                 "databaseName": "CinnamonSwirl",
                 "username": "",
-                "password": ""
+                "password": "",
+                "maxPoolSize": "100",
+                "minPoolSize": "0",
+                "compressors": "zlib",
+                "serverSelectionTimeoutMS": "30000",
+                "socketTimeoutMS": "0",
+                "readPreference": "primary"
             },
             "DISCORD": {
                 "clientID": "",
                 "token": ""
+            },
+            "SCHEDULING": {
+                "refreshIntervalMinimum": "30",
+                "refreshIntervalMaximum": "900",
+                "lookAheadMinimum": "300",
+                "lookAheadMaximum": "3600",
+                "checkInterval": "60",
+                "denseClusterSize": "10",
+                "denseClusterWindow": "120",
+                "queryLatencyTarget": "0.5"
+            },
+            "ADMISSION": {
+                "commandBurst": "5",
+                "commandRate": "0.2",
+                "maxConcurrentQueries": "10",
+                "maxPendingReminders": "25"
+            },
+            "TRACING": {
+                "enabled": "True",
+                "sampleRate": "0.1",
+                "exportPath": "traces.jsonl"
             }
         }
         if category is None and item is not None:
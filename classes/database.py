@@ -3,15 +3,70 @@ from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 from warnings import warn as console_warning
 from logging import debug, info, warning, error
 from pymongo.collection import Collection
+from pymongo.monitoring import ConnectionPoolListener
+from threading import Lock
 from classes import Configuration
 from typing import Union, Optional, Literal
 
 __all__ = "MongoDB",
 
 
+class PoolMonitor(ConnectionPoolListener):
+    """
+    Counts connection pool events so we can see how busy the pool is. pymongo fires these from motor's worker
+    threads, hence the lock.
+    """
+    def __init__(self):
+        self.lock = Lock()
+        self.open = 0
+        self.checked_out = 0
+        self.checking_out = 0
+
+    def connection_check_out_started(self, event) -> None:
+        with self.lock:
+            self.checking_out += 1
+
+    def connection_check_out_failed(self, event) -> None:
+        with self.lock:
+            self.checking_out -= 1
+
+    def connection_checked_out(self, event) -> None:
+        with self.lock:
+            self.checking_out -= 1
+            self.checked_out += 1
+
+    def connection_checked_in(self, event) -> None:
+        with self.lock:
+            self.checked_out -= 1
+
+    def connection_created(self, event) -> None:
+        with self.lock:
+            self.open += 1
+
+    def connection_closed(self, event) -> None:
+        with self.lock:
+            self.open -= 1
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_cleared(self, event) -> None:
+        pass
+
+    def pool_closed(self, event) -> None:
+        pass
+
+
 class MongoDB:
     def __init__(self, configuration_file: Configuration):
         self.configuration_file = configuration_file
+        self.pool_monitor = PoolMonitor()
 
         assert self._validate()
 
@@ -34,16 +89,56 @@ class MongoDB:
             console_warning("No connectionString in the DATABASE section in configuration file. Reverting to default.")
             self.configuration_file.fallback(category="DATABASE", item="connectionString")
 
-        assert "username", "password" in self.configuration_file['DATABASE']
+        for key in ("databaseName", "username", "password", "maxPoolSize", "minPoolSize", "compressors",
+                    "serverSelectionTimeoutMS", "socketTimeoutMS", "readPreference"):
+            try:
+                assert key in self.configuration_file['DATABASE']
+            except AssertionError:
+                console_warning(f"No {key} in the DATABASE section in configuration file. Reverting to default.")
+                self.configuration_file.fallback(category="DATABASE", item=key)
+
         info("classes.database.MongoDB: Finished validation of database configuration")
         return True
 
     def _start_asynchronous(self) -> AsyncIOMotorClient:
         info("classes.database.MongoDB: Trying to connect to provided DB via motor")
-        return AsyncIOMotorClient(host=self.configuration_file["DATABASE"]["connectionString"],
-                                  username=self.configuration_file["DATABASE"]["username"],
-                                  password=self.configuration_file["DATABASE"]["password"],
-                                  authSource=self.configuration_file["DATABASE"]["databaseName"])
+        section = self.configuration_file["DATABASE"]
+        options = {
+            "maxPoolSize": section.getint("maxPoolSize"),
+            "minPoolSize": section.getint("minPoolSize"),
+            "serverSelectionTimeoutMS": section.getint("serverSelectionTimeoutMS"),
+            "socketTimeoutMS": section.getint("socketTimeoutMS"),
+            "readPreference": section["readPreference"]
+        }
+        # zlib ships with Python. zstd and snappy need the zstandard and python-snappy packages, otherwise pymongo
+        # warns about them at every startup. The server uses the first compressor in the list it also supports.
+        # A socketTimeoutMS of 0 means no timeout, same as pymongo's default.
+        if section["compressors"]:
+            options["compressors"] = section["compressors"]
+        debug(f"classes.database.MongoDB: Client options: {options}")
+        return AsyncIOMotorClient(host=section["connectionString"],
+                                  username=section["username"],
+                                  password=section["password"],
+                                  authSource=section["databaseName"],
+                                  event_listeners=[self.pool_monitor],
+                                  **options)
+
+    def pool_health(self) -> dict:
+        """
+        Reports how the connection pool is doing right now. checking_out counts checkouts in progress, which includes
+        ones that get an idle connection straight away. It only points at an undersized pool if it stays high while
+        checked_out sits at max_pool_size.
+        :return: dict with the open, checked out and checking out connection counts and the configured pool bounds.
+        """
+        with self.pool_monitor.lock:
+            health = {
+                "open": self.pool_monitor.open,
+                "checked_out": self.pool_monitor.checked_out,
+                "checking_out": self.pool_monitor.checking_out
+            }
+        health["min_pool_size"] = self.configuration_file["DATABASE"].getint("minPoolSize")
+        health["max_pool_size"] = self.configuration_file["DATABASE"].getint("maxPoolSize")
+        return health
 
     def test(self) -> bool:
         info("classes.database.MongoDB: Testing connection to database")
@@ -100,6 +195,21 @@ class MongoDB:
             debug(f"classes.database.MongoDB: Found {len(result)} result(s).")
             return result
 
+    async def count(self, database: Union[str, AsyncIOMotorDatabase],
+                    collection: Union[str, Collection],
+                    query: dict) -> int:
+        info(f"classes.database.MongoDB: count called for db: {database}, "
+             f"collection: {collection}, query: {query}")
+        async with await self.client.start_session():
+            if type(database) is str:
+                database = self.client.get_database(database)
+            if type(collection) is str:
+                collection = database.get_collection(collection)
+            assert database.validate_collection(collection)
+            result = await collection.count_documents(filter=query)
+            debug(f"classes.database.MongoDB: Counted {result} document(s).")
+            return result
+
     async def insert_one(self, database: Union[str, AsyncIOMotorDatabase],
                          collection: Union[str, Collection],
                          query: dict) -> Union[ObjectId, None]:
@@ -128,6 +238,6 @@ class MongoDB:
             if type(collection) is str:
                 collection = database.get_collection(collection)
             assert database.validate_collection(collection)
-            result = collection.update_one(criteria, update)
+            result = await collection.update_one(criteria, update)
             if not result:
                 warning("classes.database.py: update_one did not return a result. It may not have completed.")
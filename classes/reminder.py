@@ -14,6 +14,7 @@ class Reminder:
         self.message = message
         self.recipient = recipient
         self.completed = False
+        self.trace = {}
 
     def __bool__(self) -> bool:
         return bool(self._id)
@@ -0,0 +1,117 @@
+from warnings import warn as console_warning
+from logging import debug, info
+from datetime import datetime, timedelta
+from time import monotonic
+from classes import Configuration
+
+__all__ = "Scheduler",
+
+
+class Scheduler:
+    def __init__(self, configuration_file: Configuration):
+        """
+        Decides how often the reminders buffer is refreshed and how far ahead it looks. Starts from the old fixed
+        values (5 minute refresh, 20 minute look-ahead) and adjusts them after every refresh, staying inside the
+        bounds given in the SCHEDULING section of the configuration file. All values there are in seconds, except
+        denseClusterSize which is a count of reminders.
+        :param configuration_file: The Configuration object for the bot.
+        """
+        self.configuration_file = configuration_file
+        self._validate()
+
+        section = self.configuration_file["SCHEDULING"]
+        self.refresh_interval_minimum = section.getfloat("refreshIntervalMinimum")
+        self.refresh_interval_maximum = section.getfloat("refreshIntervalMaximum")
+        self.look_ahead_minimum = section.getfloat("lookAheadMinimum")
+        self.look_ahead_maximum = section.getfloat("lookAheadMaximum")
+        self.check_interval = section.getfloat("checkInterval")
+        self.dense_cluster_size = section.getint("denseClusterSize")
+        self.dense_cluster_window = section.getfloat("denseClusterWindow")
+        self.latency_target = section.getfloat("queryLatencyTarget")
+
+        self.refresh_interval = self._clamp(300.0, self.refresh_interval_minimum, self.refresh_interval_maximum)
+        self.look_ahead = self._clamp(1200.0, self.look_ahead_minimum, self.look_ahead_maximum)
+        self.refresh_soon = False
+        self.last_refresh = float("-inf")
+
+    def _validate(self) -> None:
+        try:
+            assert "SCHEDULING" in self.configuration_file
+        except AssertionError:
+            console_warning("No SCHEDULING section in configuration file. Reverting to default.")
+            self.configuration_file.fallback(category="SCHEDULING")
+
+        for key in ("refreshIntervalMinimum", "refreshIntervalMaximum", "lookAheadMinimum", "lookAheadMaximum",
+                    "checkInterval", "denseClusterSize", "denseClusterWindow", "queryLatencyTarget"):
+            try:
+                assert key in self.configuration_file["SCHEDULING"]
+            except AssertionError:
+                console_warning(f"No {key} in the SCHEDULING section in configuration file. Reverting to default.")
+                self.configuration_file.fallback(category="SCHEDULING", item=key)
+
+        section = self.configuration_file["SCHEDULING"]
+        try:
+            assert 0 < section.getfloat("refreshIntervalMinimum") <= section.getfloat("refreshIntervalMaximum")
+            assert 0 < section.getfloat("lookAheadMinimum") <= section.getfloat("lookAheadMaximum")
+            assert section.getfloat("checkInterval") > 0
+            assert section.getfloat("queryLatencyTarget") > 0
+            assert section.getfloat("denseClusterWindow") > 0
+            assert section.getint("denseClusterSize") > 0
+        except (AssertionError, ValueError):
+            console_warning("SCHEDULING values in configuration file are out of range. Reverting to default.")
+            self.configuration_file.fallback(category="SCHEDULING")
+
+    @staticmethod
+    def _clamp(value: float, lowest: float, highest: float) -> float:
+        return max(lowest, min(value, highest))
+
+    def observe(self, due_times: list, fetch_limit: int, latency: float) -> None:
+        """
+        Adjusts the look-ahead window and refresh interval from the result of the last buffer refresh.
+        A buffer close to the fetch limit shrinks the look-ahead so we don't miss reminders past the cut-off, a nearly
+        empty one grows it so we can refresh less often. A slow query pushes the refresh interval up, but the interval
+        never grows past the look-ahead window, otherwise reminders could slip through the gap between refreshes.
+        :param due_times: The times of the reminders currently in the buffer.
+        :param fetch_limit: The most reminders a single refresh will fetch.
+        :param latency: How long the refresh query took, in seconds.
+        :return: None
+        """
+        self.last_refresh = monotonic()
+        count = len(due_times)
+        if count >= fetch_limit * 0.8:
+            self.look_ahead = self._clamp(self.look_ahead / 2, self.look_ahead_minimum, self.look_ahead_maximum)
+        elif count <= fetch_limit * 0.2:
+            self.look_ahead = self._clamp(self.look_ahead * 1.5, self.look_ahead_minimum, self.look_ahead_maximum)
+
+        interval = self.look_ahead / 4
+        if latency > self.latency_target:
+            interval *= latency / self.latency_target
+        interval = min(interval, self.look_ahead - latency)
+        self.refresh_interval = self._clamp(interval, self.refresh_interval_minimum, self.refresh_interval_maximum)
+
+        cluster_end = datetime.utcnow() + timedelta(seconds=self.dense_cluster_window)
+        cluster = [time for time in due_times if time < cluster_end]
+        # A full buffer means there are likely more reminders waiting in the database than we fetched.
+        self.refresh_soon = len(cluster) >= self.dense_cluster_size or count >= fetch_limit
+
+        info(f"classes.scheduler.Scheduler: {count} reminder(s) buffered in {latency:.3f}s. "
+             f"Refreshing every {self.refresh_interval:.0f}s with a {self.look_ahead:.0f}s look-ahead.")
+        if self.refresh_soon:
+            debug(f"classes.scheduler.Scheduler: {len(cluster)} reminder(s) due in the next "
+                  f"{self.dense_cluster_window:.0f}s. Asking for an early refresh.")
+
+    def early_refresh_due(self) -> bool:
+        """
+        Whether check_buffer should refresh straight away. Even with a dense cluster coming up we never refresh more
+        often than refreshIntervalMinimum.
+        :return: bool
+        """
+        return self.refresh_soon and not self.recently_refreshed()
+
+    def recently_refreshed(self) -> bool:
+        """
+        Whether the buffer was refreshed less than refreshIntervalMinimum ago, e.g. by an early refresh. The regular
+        refresh skips its turn when this is True so dense periods don't get two queries back to back.
+        :return: bool
+        """
+        return monotonic() - self.last_refresh < self.refresh_interval_minimum
@@ -0,0 +1,145 @@
+from warnings import warn as console_warning
+from logging import debug, warning
+from asyncio import get_running_loop
+from datetime import timezone
+from json import dumps, loads
+from time import time
+from os import path
+from threading import Lock
+from classes import Configuration
+from .reminder import Reminder
+
+__all__ = "Tracer",
+
+STAGES = ("created", "persisted", "buffered", "due", "dispatched", "delivered", "completed")
+
+
+class Tracer:
+    def __init__(self, configuration_file: Configuration):
+        """
+        Stamps sampled reminders as they move through the bot and writes one span per stage to a JSONL file once the
+        reminder is completed. Settings come from the TRACING section of the configuration file.
+        Reminders are rebuilt from the database on every buffer refresh, so stamps are kept here by _id until the
+        reminder completes rather than on the Reminder object alone.
+        :param configuration_file: The Configuration object for the bot.
+        """
+        self.configuration_file = configuration_file
+        self._validate()
+
+        section = self.configuration_file["TRACING"]
+        self.enabled = section.getboolean("enabled")
+        self.sample_rate = section.getfloat("sampleRate")
+        self.export_path = section["exportPath"]
+        self.active = {}
+        self.lock = Lock()
+
+    def _validate(self) -> None:
+        try:
+            assert "TRACING" in self.configuration_file
+        except AssertionError:
+            console_warning("No TRACING section in configuration file. Reverting to default.")
+            self.configuration_file.fallback(category="TRACING")
+
+        for key in ("enabled", "sampleRate", "exportPath"):
+            try:
+                assert key in self.configuration_file["TRACING"]
+            except AssertionError:
+                console_warning(f"No {key} in the TRACING section in configuration file. Reverting to default.")
+                self.configuration_file.fallback(category="TRACING", item=key)
+
+    def _sampled(self, reminder: Reminder) -> bool:
+        # Decided from the ObjectId so every copy of the same reminder gets the same answer.
+        return int(str(reminder._id), 16) % 10000 < self.sample_rate * 10000
+
+    def stamp(self, reminder: Reminder, stage: str) -> None:
+        """
+        Records the current time for a stage of the reminder's life. A stage is only recorded the first time, except
+        buffered, which is recorded again on every refresh until the reminder is due. That way buffered->due shows
+        the last refresh gap rather than the whole time since the reminder was created.
+        The due stage is recorded as the time the reminder was meant to go off, not the time it was noticed.
+        :param reminder: The reminder to stamp.
+        :param stage: One of STAGES.
+        :return: None
+        """
+        if not self.enabled:
+            return
+        assert stage in STAGES
+
+        # Sampling needs the _id, so it's decided at persisted. Until then every reminder is stamped, it's just a dict.
+        if reminder._id is not None:
+            if reminder._id in self.active:
+                reminder.trace = self.active[reminder._id]
+            elif self._sampled(reminder):
+                self.active[reminder._id] = reminder.trace
+            else:
+                return
+
+        now = time()
+        due = reminder.time.replace(tzinfo=timezone.utc).timestamp()
+        if stage not in reminder.trace or (stage == "buffered" and now < due):
+            if stage == "due":
+                reminder.trace[stage] = due
+            else:
+                reminder.trace[stage] = now
+
+        if stage == "completed" and reminder._id in self.active:
+            self._export(reminder)
+
+    def _export(self, reminder: Reminder) -> None:
+        trace = self.active.pop(reminder._id)
+        stamped = [stage for stage in STAGES if stage in trace]
+        spans = []
+        for start, end in zip(stamped, stamped[1:]):
+            spans.append({"trace_id": str(reminder._id), "name": f"{start}->{end}",
+                          "start": trace[start], "end": trace[end], "duration": trace[end] - trace[start]})
+        # End to end is measured from due, the time before that is just however long the user asked to wait.
+        if "due" in trace and "completed" in trace:
+            spans.append({"trace_id": str(reminder._id), "name": "due->completed",
+                          "start": trace["due"], "end": trace["completed"],
+                          "duration": trace["completed"] - trace["due"]})
+
+        # Written in an executor so the file never holds up sending reminders.
+        get_running_loop().run_in_executor(None, self._write, spans)
+
+    def _write(self, spans: list) -> None:
+        try:
+            with self.lock, open(file=self.export_path, mode="a") as file:
+                for span in spans:
+                    file.write(dumps(span) + "\n")
+        except OSError:
+            warning(f"classes.tracing.Tracer: Unable to write spans to {self.export_path}")
+            return
+        debug(f"classes.tracing.Tracer: Exported {len(spans)} span(s)")
+
+    async def report(self) -> str:
+        """
+        Reads every exported span and summarises the latency of each stage. The file is read in an executor so a
+        large trace file doesn't block the event loop.
+        :return: str, one line per stage with the count and 50th, 90th and 99th percentiles in seconds.
+        """
+        return await get_running_loop().run_in_executor(None, self._report)
+
+    def _report(self) -> str:
+        def _percentile(values: list, percent: int) -> float:
+            index = max(0, -(-len(values) * percent // 100) - 1)
+            return values[index]
+
+        if not path.exists(self.export_path):
+            return "No traces have been recorded yet."
+
+        durations = {}
+        with self.lock, open(file=self.export_path, mode="r") as file:
+            for line in file:
+                if line.strip():
+                    span = loads(line)
+                    durations.setdefault(span["name"], []).append(span["duration"])
+
+        response = ""
+        for name in sorted(durations, key=lambda x: (STAGES.index(x.split("->")[0]), STAGES.index(x.split("->")[1]))):
+            values = sorted(durations[name])
+            response += f"{name}: n={len(values)} p50={_percentile(values, 50):.2f}s " \
+                        f"p90={_percentile(values, 90):.2f}s p99={_percentile(values, 99):.2f}s\n"
+        # check_buffer sends anything due within the next minute, so these can legitimately be negative.
+        response += "Negative due->dispatched and due->completed times mean the reminder went out early.\n"
+        response += "Negative buffered->due times mean the reminder was already overdue when first buffered.\n"
+        return response